@@ -4,18 +4,24 @@ build-edge-images.py
 Build bootable container and QCOW2 images for WindGuard edge devices
 """
 
-import yaml
+import argparse
+import base64
+import json
+import os
 import subprocess
 import sys
-import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-class Colors:
-    RED = '\033[0;31m'
-    GREEN = '\033[0;32m'
-    YELLOW = '\033[1;33m'
-    BLUE = '\033[0;34m'
-    NC = '\033[0m'
+from windguard_common import (
+    Colors,
+    execute_step,
+    get_command_output,
+    load_config,
+    log,
+    setup_environment as setup_common_environment,
+)
 
 # Constants
 REPOSITORIES = [
@@ -26,94 +32,82 @@ REPOSITORIES = [
 PACKAGES = [
     "flightctl",
     "container-tools",
-    "openshift-clients"
+    "openshift-clients",
+    "libyaml"
 ]
 
-IMAGE_BASE = "windguard-microshift"
-IMAGE_TAG = "demo"
-QCOW2_TAG = "demo-qcow2"
 BOOTC_BUILDER = "registry.redhat.io/rhel9/bootc-image-builder:latest"
 BUILD_DIR = "demo-environment-setup/microshift-im-build"
 
-def log(message, color=Colors.GREEN):
-    """Print colored log message"""
-    print(f"{color}{message}{Colors.NC}")
-
-def execute_step(step_name, command, shell=True, env=None, cwd=None):
-    """Execute a command with logging and error handling"""
-    log(f"\n[STEP] {step_name}", Colors.BLUE)
-    try:
-        if isinstance(command, list):
-            subprocess.run(command, check=True, capture_output=False, env=env, cwd=cwd)
-        else:
-            subprocess.run(command, shell=shell, check=True, env=env, cwd=cwd)
-        log(f"[SUCCESS] {step_name}", Colors.GREEN)
-        return True
-    except subprocess.CalledProcessError as e:
-        log(f"[FAILED] {step_name}", Colors.RED)
-        log(f"Error: {e}", Colors.RED)
-        sys.exit(1)
-
-def get_command_output(command, shell=True, cwd=None):
-    """Execute command and return output"""
-    try:
-        result = subprocess.run(
-            command,
-            shell=shell,
-            capture_output=True,
-            text=True,
-            check=True,
-            cwd=cwd
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        log(f"Error executing command: {e}", Colors.RED)
-        sys.exit(1)
-
-def load_config(config_file):
-    """Load and validate configuration file"""
-    if not Path(config_file).exists():
-        log(f"Error: Configuration file '{config_file}' not found", Colors.RED)
-        sys.exit(1)
-
-    log(f"Loading configuration from {config_file}", Colors.BLUE)
-
-    with open(config_file, 'r') as f:
-        config = yaml.safe_load(f)
-
-    # Validate required fields
-    required_keys = ['redhat_registry', 'private_registry', 'ocp_cluster']
-    for key in required_keys:
-        if key not in config:
-            log(f"Error: Missing required key '{key}' in config file", Colors.RED)
-            sys.exit(1)
-
-    return config
-
 def setup_environment(config):
     """Setup environment variables from config"""
+    env, private_reg, ocp, ocp_api_url = setup_common_environment(config)
     redhat_reg = config['redhat_registry']
-    private_reg = config['private_registry']
-    ocp = config['ocp_cluster']
-
-    ocp_api_url = f"https://api.{ocp['domain']}:6443"
 
-    env = os.environ.copy()
-    env['OCP_CLUSTER_DOMAIN'] = ocp['domain']
-    env['REGISTRY_URL'] = private_reg['url']
-    env['REGISTRY_USER'] = private_reg['username']
-    env['BOOTC_IMAGE'] = f"{private_reg['url']}/{private_reg['username']}/{IMAGE_BASE}:{IMAGE_TAG}"
-    env['QCOW_IMAGE'] = f"{private_reg['url']}/{private_reg['username']}/{IMAGE_BASE}:{QCOW2_TAG}"
+    # Raise podman's layer copy parallelism (default 6) so image pushes
+    # and pulls saturate the available bandwidth. CONTAINERS_CONF_OVERRIDE
+    # is merged on top of the system and user containers.conf, so the
+    # host's other engine settings stay in effect. mkstemp gives the file
+    # an unpredictable name created with O_EXCL, so nobody can pre-plant
+    # a symlink or their own config in the shared temp dir
+    try:
+        fd, containers_conf = tempfile.mkstemp(prefix="windguard-containers-", suffix=".conf")
+        with os.fdopen(fd, 'w') as f:
+            f.write("[engine]\nimage_parallel_copies = 20\n")
+        env['CONTAINERS_CONF_OVERRIDE'] = containers_conf
+    except OSError as e:
+        log(f"Warning: Could not write containers.conf, using podman defaults: {e}", Colors.YELLOW)
 
     return env, redhat_reg, private_reg, ocp, ocp_api_url
 
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Build bootable container and QCOW2 images for WindGuard edge devices'
+    )
+    parser.add_argument(
+        'config_file',
+        nargs='?',
+        default='demo-config.yaml',
+        help='Path to config file (default: demo-config.yaml)'
+    )
+    parser.add_argument(
+        '--force-rebuild',
+        action='store_true',
+        help='Disable layer caching (podman build --no-cache) for release builds'
+    )
+    parser.add_argument(
+        '--layered',
+        action='store_true',
+        help='Build layered images instead of squashed ones (faster local iteration)'
+    )
+    parser.add_argument(
+        '--refresh-builder',
+        action='store_true',
+        help='Re-check the registry for a newer bootc-image-builder (--pull=newer)'
+    )
+    parser.add_argument(
+        '--serial',
+        action='store_true',
+        help='Run the bootc push and QCOW2 build serially (easier debugging)'
+    )
+    parser.add_argument(
+        '--verify-creds',
+        action='store_true',
+        help='Validate registry credentials with podman login before building'
+    )
+    return parser.parse_args()
+
 def main():
     """Main execution function"""
     # Parse arguments
-    config_file = sys.argv[1] if len(sys.argv) > 1 else "demo-config.yaml"
+    args = parse_args()
 
     # Load configuration
-    config = load_config(config_file)
+    config = load_config(
+        args.config_file,
+        required_keys=('redhat_registry', 'private_registry', 'ocp_cluster')
+    )
     env, redhat_reg, private_reg, ocp, ocp_api_url = setup_environment(config)
 
     # Verify build directory exists
@@ -132,125 +126,217 @@ def main():
 
     # Enable repositories
     log("\n=== System Setup ===", Colors.GREEN)
-    repo_args = ' '.join([f"--enable {repo}" for repo in REPOSITORIES])
+    repo_cmd = ["subscription-manager", "repos"]
+    for repo in REPOSITORIES:
+        repo_cmd += ["--enable", repo]
     execute_step(
         "Enabling RHEL repositories",
-        f"subscription-manager repos {repo_args}",
+        repo_cmd,
         env=env
     )
 
     # Install packages
-    package_list = ' '.join(PACKAGES)
     execute_step(
         "Installing required packages",
-        f"dnf install -y {package_list}",
+        ["dnf", "install", "-y"] + PACKAGES,
         env=env
     )
 
-    # Login to registries
-    log("\n=== Registry Authentication ===", Colors.GREEN)
-    execute_step(
-        "Logging into private registry",
-        f"podman login {private_reg['url']} --username {private_reg['username']} --password {private_reg['password']} --authfile=auth.json",
-        env=env,
-        cwd=BUILD_DIR
-    )
-
-    execute_step(
-        "Logging into registry.redhat.io",
-        f"podman login registry.redhat.io --username {redhat_reg['username']} --password {redhat_reg['password']} --authfile=auth.json",
-        env=env,
-        cwd=BUILD_DIR
-    )
+    # Write the registry auth file directly instead of forking podman
+    # login twice; each login pings its registry just to end up writing
+    # the same docker-config JSON
+    log("\n=== Registry and OpenShift Authentication ===", Colors.GREEN)
+    log(f"Writing registry credentials to {BUILD_DIR}/auth.json", Colors.BLUE)
+
+    def _docker_auth(username, password):
+        return base64.b64encode(f"{username}:{password}".encode()).decode()
+
+    auth = {
+        "auths": {
+            private_reg['url']: {
+                "auth": _docker_auth(private_reg['username'], private_reg['password'])
+            },
+            "registry.redhat.io": {
+                "auth": _docker_auth(redhat_reg['username'], redhat_reg['password'])
+            }
+        }
+    }
+    # 0600 like podman login's authfile; the JSON holds raw credentials
+    auth_file = Path(BUILD_DIR) / "auth.json"
+    fd = os.open(auth_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(auth, f)
+
+    if args.verify_creds:
+        # Optionally validate the credentials against both registries
+        # before spending time on the builds; the two logins are
+        # independent network round-trips, so run them concurrently
+        verify_steps = [
+            (
+                "Verifying private registry credentials",
+                ["podman", "login", private_reg['url'],
+                 "--username", private_reg['username'],
+                 "--password", private_reg['password'],
+                 "--authfile=auth.json"]
+            ),
+            (
+                "Verifying registry.redhat.io credentials",
+                ["podman", "login", "registry.redhat.io",
+                 "--username", redhat_reg['username'],
+                 "--password", redhat_reg['password'],
+                 "--authfile=auth.json"]
+            )
+        ]
+
+        with ThreadPoolExecutor(max_workers=len(verify_steps)) as executor:
+            results = list(executor.map(
+                lambda step: execute_step(step[0], step[1], env=env, cwd=BUILD_DIR, exit_on_error=False),
+                verify_steps
+            ))
+
+        if not all(results):
+            log("Error: Registry credential verification failed", Colors.RED)
+            sys.exit(1)
 
-    # Login to OpenShift
-    log("\n=== OpenShift Setup ===", Colors.GREEN)
     execute_step(
         "Logging into OpenShift cluster",
-        f"oc login -u {ocp['username']} -p {ocp['password']} {ocp_api_url} --insecure-skip-tls-verify=true",
+        ["oc", "login", "-u", ocp['username'], "-p", ocp['password'],
+         ocp_api_url, "--insecure-skip-tls-verify=true"],
         env=env
     )
 
+    # Pre-warm the oc discovery cache once so the oc calls below hit the
+    # local cache instead of each re-fetching discovery data
+    subprocess.run(
+        ['oc', 'api-resources'],
+        env=env, check=False,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
     # Extract pull secret
+    log("\n=== OpenShift Setup ===", Colors.GREEN)
+    # oc extract base64-decodes the key itself, so no Go template
+    # evaluation and no shell redirect are needed
     execute_step(
         "Extracting OpenShift pull secret",
-        "oc get secret/pull-secret -n openshift-config --template='{{index .data \".dockerconfigjson\" | base64decode}}' > pull-secret",
+        ["oc", "extract", "secret/pull-secret", "-n", "openshift-config",
+         "--to=-", "--keys=.dockerconfigjson"],
         env=env,
-        cwd=BUILD_DIR
+        output_file=Path(BUILD_DIR) / "pull-secret"
     )
 
     # Get FlightCtl API URL and login
     log("\n=== FlightCtl Setup ===", Colors.GREEN)
     rhem_api_url = get_command_output(
-        "oc get route -n open-cluster-management flightctl-api-route -o json | jq -r .spec.host"
+        ["oc", "get", "route", "-n", "open-cluster-management",
+         "flightctl-api-route", "-o", "jsonpath={.spec.host}"]
     )
     env['RHEM_API_SERVER_URL'] = rhem_api_url
     log(f"FlightCtl API: {rhem_api_url}", Colors.YELLOW)
 
     execute_step(
         "Logging into FlightCtl",
-        f"flightctl login --username={ocp['username']} --password={ocp['password']} https://{rhem_api_url} --insecure-skip-tls-verify",
+        ["flightctl", "login",
+         f"--username={ocp['username']}", f"--password={ocp['password']}",
+         f"https://{rhem_api_url}", "--insecure-skip-tls-verify"],
         env=env
     )
 
     execute_step(
         "Verifying FlightCtl version",
-        "flightctl version",
+        ["flightctl", "version"],
         env=env
     )
 
     # Request enrollment certificate
     execute_step(
         "Requesting FlightCtl enrollment certificate",
-        "flightctl certificate request --signer=enrollment --expiration=365d --output=embedded > config.yaml",
+        ["flightctl", "certificate", "request",
+         "--signer=enrollment", "--expiration=365d", "--output=embedded"],
         env=env,
-        cwd=BUILD_DIR
+        cwd=BUILD_DIR,
+        output_file=Path(BUILD_DIR) / "config.yaml"
     )
 
     # Build bootc image
+    # Squashed images ship as a single layer, so edge devices pay one
+    # registry round-trip instead of one per layer on first boot.
+    # --layered opts back into cached layered builds for local iteration
+    # (--squash conflicts with --layers, so squashed builds only honour
+    # --force-rebuild via --no-cache)
+    if args.layered:
+        bootc_build_args = qcow2_build_args = ["--no-cache"] if args.force_rebuild else ["--layers"]
+    else:
+        no_cache = ["--no-cache"] if args.force_rebuild else []
+        bootc_build_args = ["--squash-all"] + no_cache
+        qcow2_build_args = ["--squash"] + no_cache
+
     log("\n=== Building Bootable Container Image ===", Colors.GREEN)
     execute_step(
         "Building bootc container image",
-        f"podman build --rm --no-cache -t {env['BOOTC_IMAGE']} .",
+        ["podman", "build", "--rm"] + bootc_build_args + ["-t", env['BOOTC_IMAGE'], "."],
         env=env,
         cwd=BUILD_DIR
     )
 
-    execute_step(
-        "Pushing bootc image to registry",
-        f"podman push {env['BOOTC_IMAGE']} --authfile=auth.json",
-        env=env
-    )
+    # The push is network-bound while the QCOW2 generation below is
+    # CPU/disk-bound and only needs the local image, so overlap them and
+    # join before the final registry-dependent push
+    push_cmd = ["podman", "push", env['BOOTC_IMAGE'], "--authfile=auth.json"]
+    push_proc = None
+    if args.serial:
+        execute_step("Pushing bootc image to registry", push_cmd, env=env)
+    else:
+        log("\n[STEP] Pushing bootc image to registry (in background)", Colors.BLUE)
+        push_proc = subprocess.Popen(push_cmd, env=env)
 
     # Build QCOW2 image
     log("\n=== Building QCOW2 Disk Image ===", Colors.GREEN)
     output_path = (build_path / "output").absolute()
     output_path.mkdir(exist_ok=True)
 
-    execute_step(
-        "Building QCOW2 image with bootc-image-builder",
-        f"podman run --rm -it --privileged --pull=newer "
-        f"--security-opt label=type:unconfined_t "
-        f"-v {output_path}:/output "
-        f"-v ./config.toml:/config.toml "
-        f"-v /var/lib/containers/storage:/var/lib/containers/storage "
-        f"{BOOTC_BUILDER} --type qcow2 {env['BOOTC_IMAGE']}",
-        env=env,
-        cwd=BUILD_DIR
-    )
+    # --pull=missing skips the registry freshness check when the builder
+    # image is already local; --refresh-builder re-enables it
+    builder_pull = "--pull=newer" if args.refresh_builder else "--pull=missing"
 
-    # Build and push QCOW2 container
-    log("\n=== Creating QCOW2 Container Image ===", Colors.GREEN)
-    execute_step(
-        "Building QCOW2 container image",
-        f"podman build --rm --no-cache -t {env['QCOW_IMAGE']} -f Containerfile.ocpvirt .",
-        env=env,
-        cwd=BUILD_DIR
-    )
+    # If either step below aborts the script, stop the background push
+    # instead of orphaning it to keep writing to the terminal
+    try:
+        execute_step(
+            "Building QCOW2 image with bootc-image-builder",
+            ["podman", "run", "--rm", "-it", "--privileged", builder_pull,
+             "--security-opt", "label=type:unconfined_t",
+             "-v", f"{output_path}:/output",
+             "-v", "./config.toml:/config.toml",
+             "-v", "/var/lib/containers/storage:/var/lib/containers/storage",
+             BOOTC_BUILDER, "--type", "qcow2", env['BOOTC_IMAGE']],
+            env=env,
+            cwd=BUILD_DIR
+        )
+
+        # Build and push QCOW2 container
+        log("\n=== Creating QCOW2 Container Image ===", Colors.GREEN)
+        execute_step(
+            "Building QCOW2 container image",
+            ["podman", "build", "--rm"] + qcow2_build_args + ["-t", env['QCOW_IMAGE'], "-f", "Containerfile.ocpvirt", "."],
+            env=env,
+            cwd=BUILD_DIR
+        )
+    except SystemExit:
+        if push_proc is not None and push_proc.poll() is None:
+            push_proc.terminate()
+            push_proc.wait()
+        raise
+
+    if push_proc is not None:
+        if push_proc.wait() != 0:
+            log("[FAILED] Pushing bootc image to registry", Colors.RED)
+            sys.exit(1)
+        log("[SUCCESS] Pushing bootc image to registry", Colors.GREEN)
 
     execute_step(
         "Pushing QCOW2 container image to registry",
-        f"podman push {env['QCOW_IMAGE']} --authfile=auth.json",
+        ["podman", "push", env['QCOW_IMAGE'], "--authfile=auth.json"],
         env=env
     )
 
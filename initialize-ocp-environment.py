@@ -10,14 +10,18 @@ Requires: oc CLI (logged in) or demo-config.yaml for authentication
 """
 
 import argparse
+import os
 import sys
 import time
 import subprocess
 import json
 import signal
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-import yaml
+
+from windguard_common import Colors, KUBE_CACHE_DIR, _read_config_cached
+from windguard_common import log as _log
 
 # ======== CONFIGURATION ========
 DEFAULT_NAMESPACE = "openshift-gitops"
@@ -27,31 +31,10 @@ CONSOLE_RESOURCE = "console.operator.openshift.io/cluster"
 CONFIG_FILE = "demo-config.yaml"
 # ===============================
 
-# ======== COLORS ========
-RED = '\033[0;31m'
-GREEN = '\033[0;32m'
-YELLOW = '\033[1;33m'
-BLUE = '\033[0;34m'
-NC = '\033[0m'
-# =========================
-
-
-class Colors:
-    """ANSI color codes for terminal output"""
-    RED = '\033[0;31m'
-    GREEN = '\033[0;32m'
-    YELLOW = '\033[1;33m'
-    BLUE = '\033[0;34m'
-    NC = '\033[0m'
-
-
 def log(message, color=None):
     """Print timestamped log message"""
     timestamp = datetime.now().strftime('%H:%M:%S')
-    if color:
-        print(f"{color}[{timestamp}] {message}{Colors.NC}")
-    else:
-        print(f"[{timestamp}] {message}")
+    _log(f"[{timestamp}] {message}", color)
 
 
 def signal_handler(sig, frame):
@@ -66,8 +49,7 @@ def load_config(config_path):
         return None
 
     try:
-        with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+        return _read_config_cached(config_path)
     except Exception as e:
         log(f"⚠️  Warning: Could not load config file: {e}", Colors.YELLOW)
         return None
@@ -155,12 +137,15 @@ def get_app_status(app_name, namespace):
     return sync_status, health_status
 
 
-def wait_for_app(app_name, namespace, interval, timeout):
-    """Wait for ArgoCD Application to be Synced and Healthy"""
-    log(f"🔍 Checking ArgoCD Application: {app_name}", Colors.BLUE)
-
+def poll_for_app(app_name, namespace, interval, timeout):
+    """Wait for an application by polling its status (fallback for old oc)"""
     start_time = time.time()
 
+    # Exponential backoff capped at the configured interval: deployments
+    # that turn healthy quickly are noticed in under a second, while
+    # long waits settle at the original polling rate
+    delay = 0.5
+
     while True:
         sync_status, health_status = get_app_status(app_name, namespace)
 
@@ -173,7 +158,8 @@ def wait_for_app(app_name, namespace, interval, timeout):
             return True
 
         log(f"⏳ {app_name} -> Sync={sync_status}, Health={health_status} (waiting...)", Colors.YELLOW)
-        time.sleep(interval)
+        time.sleep(delay)
+        delay = min(delay * 2, interval)
 
         elapsed = time.time() - start_time
         if elapsed >= timeout:
@@ -181,26 +167,78 @@ def wait_for_app(app_name, namespace, interval, timeout):
             return False
 
 
+def wait_for_app(app_name, namespace, interval, timeout):
+    """Wait for ArgoCD Application to be Synced and Healthy"""
+    log(f"🔍 Checking ArgoCD Application: {app_name}", Colors.BLUE)
+
+    deadline = time.time() + timeout
+
+    # A blocking `oc wait` per condition keeps a single watch open on the
+    # API server instead of re-spawning `oc get` (fork/exec + TLS
+    # handshake + discovery) every poll interval
+    for jsonpath, expected in (
+        ('{.status.sync.status}', 'Synced'),
+        ('{.status.health.status}', 'Healthy')
+    ):
+        remaining = max(1, int(deadline - time.time()))
+        wait_cmd = [
+            'oc', 'wait', f'applications.argoproj.io/{app_name}',
+            '-n', namespace,
+            f'--for=jsonpath={jsonpath}={expected}',
+            f'--timeout={remaining}s'
+        ]
+        code, _, stderr = run_oc_command(wait_cmd)
+
+        if code == 0:
+            continue
+
+        if 'unknown flag' in stderr.lower() or 'unrecognized condition' in stderr.lower():
+            # Older oc without jsonpath wait support
+            log(f"⚠️  'oc wait' does not support jsonpath conditions, falling back to polling", Colors.YELLOW)
+            return poll_for_app(app_name, namespace, interval, max(1, deadline - time.time()))
+
+        if 'not found' in stderr.lower():
+            log(f"❌ Application '{app_name}' not found in namespace '{namespace}'.", Colors.RED)
+            return False
+
+        # Only claim a timeout when oc actually reports one; auth, RBAC
+        # or network failures surface with their real error message
+        if 'timed out waiting for the condition' in stderr.lower():
+            log(f"❌ Timeout reached for {app_name} after {timeout}s.", Colors.RED)
+        else:
+            log(f"❌ oc wait failed for {app_name}: {stderr or f'exit code {code}'}", Colors.RED)
+        return False
+
+    log(f"✅ {app_name} is Synced and Healthy.", Colors.GREEN)
+    return True
+
+
 def patch_console():
     """Patch OpenShift Console to add flightctl-plugin"""
     log("🧩 Patching OpenShift Console to include 'flightctl-plugin'...", Colors.BLUE)
 
-    # Check if plugin is already present
-    check_cmd = [
-        'oc', 'get', CONSOLE_RESOURCE,
-        '-o', 'jsonpath={.spec.plugins}'
-    ]
+    # Parse the plugins array for an exact membership check; a substring
+    # test would also match names like 'flightctl-plugin-extra'
+    check_cmd = ['oc', 'get', CONSOLE_RESOURCE, '-o', 'json']
     code, output, _ = run_oc_command(check_cmd)
 
-    if code == 0 and 'flightctl-plugin' in output:
+    plugins = []
+    if code == 0 and output:
+        try:
+            plugins = json.loads(output).get('spec', {}).get('plugins') or []
+        except json.JSONDecodeError:
+            log("⚠️  Could not parse Console resource, patching anyway", Colors.YELLOW)
+
+    if 'flightctl-plugin' in plugins:
         log("✅ 'flightctl-plugin' already present in spec.plugins", Colors.GREEN)
         return True
 
-    # Patch the console
+    # Patch with the union so existing plugins are preserved and the
+    # cluster write only happens when the array actually changes
     patch_cmd = [
         'oc', 'patch', CONSOLE_RESOURCE,
         '--type=merge',
-        '-p', '{"spec": {"plugins": ["flightctl-plugin"]}}'
+        '-p', json.dumps({"spec": {"plugins": plugins + ['flightctl-plugin']}})
     ]
     code, _, stderr = run_oc_command(patch_cmd)
 
@@ -226,6 +264,9 @@ Environment variables can also be used:
   NAMESPACE   (default: openshift-gitops)
   INTERVAL    (default: 10)
   TIMEOUT     (default: 600)
+
+The oc discovery cache is kept in .cache/kube (via KUBECACHEDIR) so
+repeated runs reuse it.
         """
     )
 
@@ -274,13 +315,25 @@ Environment variables can also be used:
             log("❌ Failed to login to cluster", Colors.RED)
             sys.exit(1)
 
+    # Reuse a persistent oc discovery cache and pre-warm it once, so the
+    # many oc calls below skip per-invocation discovery round-trips
+    os.environ['KUBECACHEDIR'] = str(Path(KUBE_CACHE_DIR).absolute())
+    run_oc_command(['oc', 'api-resources'])
+
     # Apply manifests
     apply_manifests()
 
-    # Wait for all applications
-    for app in args.applications:
-        if not wait_for_app(app, args.namespace, args.interval, args.timeout):
-            sys.exit(2)
+    # Wait for all applications concurrently; the waits are independent,
+    # so total wall time is the slowest app instead of the sum. Log lines
+    # already carry the app name, so interleaved output stays readable
+    with ThreadPoolExecutor(max_workers=min(8, len(args.applications))) as executor:
+        results = list(executor.map(
+            lambda app: wait_for_app(app, args.namespace, args.interval, args.timeout),
+            args.applications
+        ))
+
+    if not all(results):
+        sys.exit(2)
 
     log("🎉 All specified applications are Synced and Healthy.", Colors.GREEN)
     print()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+windguard_common.py
+Shared helpers and constants for the WindGuard demo scripts
+"""
+
+import yaml
+import json
+import functools
+import shutil
+import subprocess
+import sys
+import os
+from pathlib import Path
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    NC = '\033[0m'
+
+# Precomputed (prefix, suffix) byte pairs per color; built once so log()
+# avoids re-encoding and concatenating ANSI sequences on every call
+_COLOR_WRAP = {
+    color: (color.encode(), Colors.NC.encode())
+    for color in (Colors.RED, Colors.GREEN, Colors.YELLOW, Colors.BLUE)
+}
+_USE_COLOR = sys.stdout.isatty()
+
+# Constants
+IMAGE_BASE = "windguard-microshift"
+IMAGE_TAG = "demo"
+QCOW2_TAG = "demo-qcow2"
+KUBE_CACHE_DIR = ".cache/kube"
+
+def log(message, color=Colors.GREEN):
+    """Print colored log message (ANSI is skipped on non-TTY stdout)"""
+    out = sys.stdout.buffer
+    if _USE_COLOR and color in _COLOR_WRAP:
+        prefix, suffix = _COLOR_WRAP[color]
+        out.write(prefix + message.encode() + suffix + b"\n")
+    else:
+        out.write(message.encode() + b"\n")
+    out.flush()
+
+def execute_step(step_name, command, shell=False, env=None, cwd=None,
+                 exit_on_error=True, output_file=None, input_data=None):
+    """Execute a command with logging and error handling
+
+    Commands are argv lists run without a shell; pass shell=True only for
+    the few steps that genuinely need shell features (pipes, redirects).
+    output_file redirects the command's stdout to the given path, and
+    input_data is fed to the command's stdin.
+    """
+    log(f"\n[STEP] {step_name}", Colors.BLUE)
+    try:
+        if output_file:
+            with open(output_file, 'wb') as f:
+                subprocess.run(command, shell=shell, check=True, env=env,
+                               cwd=cwd, stdout=f)
+        else:
+            subprocess.run(command, shell=shell, check=True, env=env, cwd=cwd,
+                           input=input_data, text=input_data is not None)
+        log(f"[SUCCESS] {step_name}", Colors.GREEN)
+        return True
+    except subprocess.CalledProcessError as e:
+        log(f"[FAILED] {step_name}", Colors.RED)
+        log(f"Error: {e}", Colors.RED)
+        if exit_on_error:
+            sys.exit(1)
+        return False
+
+def get_command_output(command, shell=False, cwd=None):
+    """Execute command and return its stdout as a string
+
+    stdout is captured as bytes and decoded once at the end, avoiding
+    text-mode universal-newlines processing on potentially large output.
+    """
+    try:
+        result = subprocess.run(
+            command,
+            shell=shell,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            cwd=cwd
+        )
+        return result.stdout.decode('utf-8', 'replace').strip()
+    except subprocess.CalledProcessError as e:
+        log(f"Error executing command: {e}", Colors.RED)
+        sys.exit(1)
+
+def _read_config_cached(config_file):
+    """Parse a YAML config file, going through its JSON sidecar cache
+
+    The sidecar is reused when newer than the YAML source and rebuilt
+    otherwise. Raises on unreadable/unparseable input; callers decide
+    how to report that.
+    """
+    # Reuse the JSON sidecar cache when it is newer than the YAML source;
+    # a corrupt or unreadable cache just falls back to re-parsing the YAML
+    cache_file = Path(config_file + ".cache.json")
+    if cache_file.exists() and cache_file.stat().st_mtime >= Path(config_file).stat().st_mtime:
+        try:
+            with open(cache_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    with open(config_file, 'r') as f:
+        config = yaml.load(f, Loader=_YamlLoader)
+
+    try:
+        # The cache duplicates the config's credentials, so create it
+        # 0600 and then mirror the source file's permissions. Dump to a
+        # temp file and os.replace so an interrupted run can never leave
+        # a truncated cache behind
+        tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(config, f)
+        shutil.copymode(config_file, tmp_file)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass  # read-only directory, cache is best-effort
+
+    return config
+
+@functools.lru_cache(maxsize=8)
+def _load_config_cached(config_file, required_keys):
+    """Load and validate a configuration file (cached per resolved path)"""
+    if not Path(config_file).exists():
+        log(f"Error: Configuration file '{config_file}' not found", Colors.RED)
+        sys.exit(1)
+
+    log(f"Loading configuration from {config_file}", Colors.BLUE)
+
+    config = _read_config_cached(config_file)
+
+    # Validate required fields
+    for key in required_keys:
+        if key not in config:
+            log(f"Error: Missing required key '{key}' in config file", Colors.RED)
+            sys.exit(1)
+
+    return config
+
+def load_config(config_file, required_keys=('private_registry', 'ocp_cluster')):
+    """Load and validate configuration file
+
+    Repeated loads of the same file within one process return the cached
+    parse; call load_config.cache_clear() to reset (e.g. in test harnesses).
+    """
+    return _load_config_cached(str(Path(config_file).resolve()), tuple(required_keys))
+
+load_config.cache_clear = _load_config_cached.cache_clear
+
+def setup_environment(config):
+    """Setup environment variables from config"""
+    private_reg = config['private_registry']
+    ocp = config['ocp_cluster']
+
+    ocp_api_url = f"https://api.{ocp['domain']}:6443"
+
+    env = os.environ.copy()
+    env['OCP_CLUSTER_DOMAIN'] = ocp['domain']
+    env['REGISTRY_URL'] = private_reg['url']
+    env['REGISTRY_USER'] = private_reg['username']
+    env['BOOTC_IMAGE'] = f"{private_reg['url']}/{private_reg['username']}/{IMAGE_BASE}:{IMAGE_TAG}"
+    env['QCOW_IMAGE'] = f"{private_reg['url']}/{private_reg['username']}/{IMAGE_BASE}:{QCOW2_TAG}"
+
+    # Keep the oc discovery/OpenAPI cache in the working tree so re-runs
+    # (and ephemeral CI homes) reuse it instead of re-downloading schemas
+    env['KUBECACHEDIR'] = str(Path(KUBE_CACHE_DIR).absolute())
+
+    return env, private_reg, ocp, ocp_api_url